@@ -62,16 +62,17 @@ def list_available_models():
         print(f"Error listing models: {e}")
         sys.exit(1)
 
-async def generate_with_model(theme: str, model: str, idx: int, total: int, generate_images: bool = False):
+async def generate_with_model(theme: str, model: str, idx: int, total: int, generate_images: bool = False, parallel_sections: bool = False):
     """
     Generate a piece with a specific model, with appropriate console output.
-    
+
     Args:
         theme (str): The theme for the composition.
         model (str): The model to use.
         idx (int): Index of the model in the list.
         total (int): Total number of models.
         generate_images (bool): Whether to generate sheet music images.
+        parallel_sections (bool): Whether to generate sections concurrently.
     """
     try:
         print(f"\n=========================================")
@@ -82,8 +83,8 @@ async def generate_with_model(theme: str, model: str, idx: int, total: int, gene
         print("1. Generating a composition plan")
         print("2. Creating the full piece based on that plan\n")
         
-        await plan_and_generate_modular_song(theme, model, generate_images=generate_images)
-        
+        await plan_and_generate_modular_song(theme, model, generate_images=generate_images, parallel_sections=parallel_sections)
+
         print(f"\nCompleted generation with model: {model}")
         return (True, model, None)
     except Exception as e:
@@ -107,6 +108,8 @@ async def main():
                         help="Run models concurrently instead of sequentially")
     parser.add_argument("--generate-images", action="store_true",
                         help="Generate sheet music images from MIDI using music21 and LilyPond")
+    parser.add_argument("--parallel-sections", action="store_true",
+                        help="Generate sections concurrently (faster, but without previous-section context)")
     args = parser.parse_args()
     
     # If --list-models flag is set, show available models and exit
@@ -164,7 +167,7 @@ async def main():
         print("1. Generating a composition plan")
         print("2. Creating the full piece based on that plan\n")
         
-        await plan_and_generate_modular_song(theme, None, generate_images=args.generate_images)
+        await plan_and_generate_modular_song(theme, None, generate_images=args.generate_images, parallel_sections=args.parallel_sections)
     else:
         print(f"\nGenerating music with theme: {theme}")
         total_models = len(models_to_run)
@@ -172,7 +175,7 @@ async def main():
         if args.concurrent:
             print(f"Running generation concurrently for {total_models} models: {', '.join(models_to_run)}")
             tasks = [
-                generate_with_model(theme, model, idx, total_models, args.generate_images)
+                generate_with_model(theme, model, idx, total_models, args.generate_images, args.parallel_sections)
                 for idx, model in enumerate(models_to_run)
             ]
             results = await asyncio.gather(*tasks, return_exceptions=False)
@@ -196,7 +199,7 @@ async def main():
         else:
             print(f"Running generation sequentially for {total_models} models: {', '.join(models_to_run)}")
             for idx, model in enumerate(models_to_run):
-                await generate_with_model(theme, model, idx, total_models, args.generate_images)
+                await generate_with_model(theme, model, idx, total_models, args.generate_images, args.parallel_sections)
                 if idx < len(models_to_run) - 1:
                     print("\nMoving to next model...\n")
 
@@ -1,9 +1,22 @@
 import os
+import re
 import subprocess
 import shutil
 import glob
+import xml.etree.ElementTree as ET
 import music21
 
+# Quarter-note division used for MusicXML durations; 480 keeps the common
+# fractional durations (1/2, 1/4, 1/3, 1/8...) integral.
+_DIVISIONS = 480
+
+# Note-name parser ('C4', 'A#5', 'Bb3') for direct MusicXML emission.
+_NOTE_NAME_RE = re.compile(r'([A-Ga-g])(#|b)?(\d+)')
+
+# Parts emitted for a ModularPiece, in score order. Percussion is unpitched
+# and channel-bound, so it is left to the MIDI file only.
+_PART_VOICES = ("Bass", "Tenor", "Alto", "Soprano", "Piano")
+
 def convert_midi_to_musicxml(midi_path: str) -> str:
     """
     Convert a MIDI file to MusicXML using music21.
@@ -22,6 +35,133 @@ def convert_midi_to_musicxml(midi_path: str) -> str:
     score.write('musicxml', fp=xml_path)
     return xml_path
 
+def _duration_divisions(duration: str) -> int:
+    """
+    Convert a duration string in beats ('1', '1/2', '0.5') to MusicXML
+    divisions.
+    """
+    try:
+        beats = float(duration)
+    except ValueError:
+        num, den = duration.split('/')
+        beats = int(num) / int(den)
+    return max(1, round(beats * _DIVISIONS))
+
+def _append_pitch(note_el: ET.Element, note_name: str) -> None:
+    """
+    Add a <pitch> element (step/alter/octave) parsed from a note name.
+    """
+    match = _NOTE_NAME_RE.match(note_name)
+    if not match:
+        raise ValueError(f"Invalid note name: {note_name}")
+    letter, accidental, octave = match.groups()
+    pitch_el = ET.SubElement(note_el, 'pitch')
+    ET.SubElement(pitch_el, 'step').text = letter.upper()
+    if accidental == '#':
+        ET.SubElement(pitch_el, 'alter').text = '1'
+    elif accidental == 'b':
+        ET.SubElement(pitch_el, 'alter').text = '-1'
+    ET.SubElement(pitch_el, 'octave').text = octave
+
+def piece_to_musicxml(piece, xml_path: str) -> str:
+    """
+    Emit MusicXML directly from a ModularPiece, skipping the MIDI round-trip.
+
+    convert_midi_to_musicxml re-parses a file we just wrote with music21,
+    which rebuilds its entire Stream graph and dominates sheet-music time.
+    The piece model already holds everything the score needs, so this walks
+    it once with ElementTree: one part per pitched voice, one MusicXML
+    measure per piece measure, simultaneous notes within a beat as chords
+    and empty beats as rests. Each beat occupies exactly one beat of
+    MusicXML time, matching the beat grid aggregate_modular_piece uses for
+    MIDI: longer durations are clamped and shorter ones padded with a rest.
+
+    Args:
+        piece: The ModularPiece to render.
+        xml_path (str): Destination path for the MusicXML file.
+
+    Returns:
+        str: Path to the generated MusicXML file.
+    """
+    time_signature = piece.metadata.time_signature
+    try:
+        ts_beats, ts_beat_type = time_signature.split('/')
+    except ValueError:
+        ts_beats, ts_beat_type = '4', '4'
+
+    score = ET.Element('score-partwise', version='3.1')
+    work = ET.SubElement(score, 'work')
+    ET.SubElement(work, 'work-title').text = piece.metadata.title
+
+    part_list = ET.SubElement(score, 'part-list')
+    for idx, voice_name in enumerate(_PART_VOICES, start=1):
+        score_part = ET.SubElement(part_list, 'score-part', id=f'P{idx}')
+        ET.SubElement(score_part, 'part-name').text = voice_name
+
+    for idx, voice_name in enumerate(_PART_VOICES, start=1):
+        attr_name = voice_name.lower()
+        part = ET.SubElement(score, 'part', id=f'P{idx}')
+        measure_number = 0
+        for section in piece.sections:
+            for phrase in section.phrases:
+                for measure in phrase.measures:
+                    measure_number += 1
+                    measure_el = ET.SubElement(part, 'measure', number=str(measure_number))
+                    if measure_number == 1:
+                        attributes = ET.SubElement(measure_el, 'attributes')
+                        ET.SubElement(attributes, 'divisions').text = str(_DIVISIONS)
+                        time_el = ET.SubElement(attributes, 'time')
+                        ET.SubElement(time_el, 'beats').text = ts_beats
+                        ET.SubElement(time_el, 'beat-type').text = ts_beat_type
+                    for beat in measure.beats:
+                        notes = [
+                            nd for nd in (getattr(beat, attr_name, None) or ())
+                            if nd.note is not None
+                        ]
+                        emitted = 0
+                        advance = 0
+                        for nd in notes:
+                            note_el = ET.SubElement(measure_el, 'note')
+                            if emitted > 0:
+                                # Notes within a beat start together; mark
+                                # the followers as chord members.
+                                ET.SubElement(note_el, 'chord')
+                            try:
+                                _append_pitch(note_el, nd.note)
+                            except ValueError:
+                                measure_el.remove(note_el)
+                                continue
+                            # The piece model gives every beat a fixed one-beat
+                            # slot (the same grid aggregate_modular_piece uses
+                            # for MIDI timestamps), so clamp longer durations:
+                            # MusicXML time advances by each non-chord note's
+                            # duration, and emitting more than one beat would
+                            # push the rest of the part late.
+                            divisions = min(_duration_divisions(nd.duration), _DIVISIONS)
+                            ET.SubElement(note_el, 'duration').text = str(divisions)
+                            if emitted == 0:
+                                advance = divisions
+                            emitted += 1
+                        if emitted == 0:
+                            # Empty beat, or every note failed to parse: a
+                            # one-beat rest keeps this part's timeline in step
+                            # with the others (MusicXML time is sequential, so
+                            # silently dropping the beat would shift the rest
+                            # of the part earlier).
+                            rest_el = ET.SubElement(measure_el, 'note')
+                            ET.SubElement(rest_el, 'rest')
+                            ET.SubElement(rest_el, 'duration').text = str(_DIVISIONS)
+                        elif advance < _DIVISIONS:
+                            # Only the first (non-chord) note advances the
+                            # timeline; pad short beats with a rest so the
+                            # beat still occupies exactly one beat.
+                            rest_el = ET.SubElement(measure_el, 'note')
+                            ET.SubElement(rest_el, 'rest')
+                            ET.SubElement(rest_el, 'duration').text = str(_DIVISIONS - advance)
+
+    ET.ElementTree(score).write(xml_path, encoding='UTF-8', xml_declaration=True)
+    return xml_path
+
 def convert_musicxml_to_image(xml_path: str, output_format: str = 'png') -> list[str]:
     """
     Convert a MusicXML file to images using LilyPond.
@@ -47,10 +187,16 @@ def convert_musicxml_to_image(xml_path: str, output_format: str = 'png') -> list
     base_name = os.path.splitext(os.path.basename(xml_path))[0]
     output_base = os.path.join(images_dir, base_name)
     
-    cmd = ['lilypond', f'--{output_format}', '-o', output_base, xml_path]
-    
+    # -dno-point-and-click skips the editor-link anchors LilyPond embeds by
+    # default; they are useless in rendered images and cost output size and
+    # render time.
+    cmd = ['lilypond', '-dno-point-and-click', f'--{output_format}', '-o', output_base, xml_path]
+
+    # Let LilyPond's GC run less eagerly during batch rendering.
+    env = dict(os.environ, LILYPOND_GC_YIELD='40')
+
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        subprocess.run(cmd, check=True, capture_output=True, text=True, env=env)
     except subprocess.CalledProcessError as e:
         print(f"LilyPond error: {e.stderr}")
         raise